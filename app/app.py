@@ -2,7 +2,18 @@
 Flask主应用
 处理钉钉机器人的消息接收和回复
 """
+# gevent补丁必须在导入requests/ssl等模块之前执行
+from gevent import monkey
+monkey.patch_all()
+
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict
+import hashlib
+import threading
+import orjson
 import sys
 import os
 
@@ -14,6 +25,7 @@ from utils.dingtalk_utils import DingTalkUtils
 from utils.openai_utils import OpenAIUtils
 from utils.pdf_utils import PDFGenerator
 from utils.audio_utils import AudioUtils, VoiceProcessor
+from utils.cache import ResultCache
 from app.scheduler import news_scheduler
 import logging
 
@@ -24,27 +36,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class OrJSONProvider(JSONProvider):
+    """使用orjson进行JSON序列化/反序列化"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # 创建Flask应用
 app = Flask(__name__)
+app.json = OrJSONProvider(app)
 app.config.from_object(Config)
 Config.init_app(app)
 
+# 请求处理热路径中使用的配置项，导入时绑定为模块常量
+DTK_SECRET = Config.DINGTALK_APP_SECRET
+DTK_APP_KEY = Config.DINGTALK_APP_KEY
+SYSTEM_PROMPT = Config.SYSTEM_PROMPT
+REPORT_KWS = Config.REPORT_TRIGGER_KEYWORDS
+
 # 初始化工具类
+result_cache = ResultCache(Config.REDIS_URL, ttl=Config.CACHE_TTL) if Config.REDIS_URL else None
 dingtalk_utils = DingTalkUtils()
 openai_utils = OpenAIUtils(
     api_key=Config.OPENAI_API_KEY,
     base_url=Config.OPENAI_BASE_URL,
-    model=Config.OPENAI_MODEL
+    model=Config.OPENAI_MODEL,
+    cache=result_cache
 )
 pdf_generator = PDFGenerator(output_dir=Config.UPLOAD_FOLDER)
 audio_utils = AudioUtils(output_dir=Config.UPLOAD_FOLDER)
+
+# 根据配置选择语音识别后端
+transcriber = None
+if Config.TRANSCRIBE_BACKEND == 'local':
+    from utils.whisper_local import LocalWhisperTranscriber
+    transcriber = LocalWhisperTranscriber(
+        model_size=Config.WHISPER_LOCAL_MODEL,
+        device=Config.WHISPER_LOCAL_DEVICE,
+        compute_type=Config.WHISPER_LOCAL_COMPUTE_TYPE
+    )
+
 voice_processor = VoiceProcessor(
     openai_utils=openai_utils,
     audio_utils=audio_utils,
-    app_key=Config.DINGTALK_APP_KEY,
-    app_secret=Config.DINGTALK_APP_SECRET
+    app_key=DTK_APP_KEY,
+    app_secret=DTK_SECRET,
+    transcriber=transcriber,
+    cache=result_cache
 )
 
+# 后台执行器：LLM/Whisper调用为I/O密集型，使用线程池（PDF渲染由PDFGenerator提交到进程池）
+executor = ThreadPoolExecutor(max_workers=50, thread_name_prefix='message-worker')
+
+# 进行中的对话请求，用于合并用户重复发送的相同消息
+INFLIGHT_TTL = 10  # 请求完成后结果保留的秒数
+_inflight_chats: Dict[bytes, Future] = {}
+_inflight_lock = threading.Lock()
+
+# 报告完成回复模板（模块加载时绑定format方法）
+REPORT_RESPONSE_TEMPLATE = """报告已生成完成！
+
+📊 报告主题：{topic}
+👤 请求人：{user_name}
+📄 文件已保存到服务器
+
+由于当前环境限制，PDF文件已保存在服务器本地。
+在生产环境中，文件将上传到云存储并提供下载链接。
+
+报告摘要：
+{summary}...
+
+完整内容请查看PDF文件。""".format
+
 
 @app.route('/', methods=['GET'])
 def index():
@@ -67,19 +135,27 @@ def webhook():
         sign = request.headers.get('sign', '')
         
         # 验证签名
-        if not dingtalk_utils.verify_signature(timestamp, sign, Config.DINGTALK_APP_SECRET):
+        if not dingtalk_utils.verify_signature(timestamp, sign, DTK_SECRET):
             logger.warning("签名验证失败")
             return jsonify({'error': '签名验证失败'}), 401
         
         # 获取请求数据
         data = request.json
-        logger.info(f"收到消息: {data}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("收到消息: %s", data)
         
         # 解析消息
         message_info = dingtalk_utils.parse_message(data)
         msg_type = message_info['msg_type']
         sender_id = message_info['sender_id']
         sender_nick = message_info['sender_nick']
+        logger.info("收到%s消息: %s", msg_type, sender_nick)
+        
+        # 如果钉钉提供了会话Webhook，则立即应答，在后台处理后异步回复
+        session_webhook = data.get('sessionWebhook')
+        if session_webhook and msg_type in ('text', 'audio'):
+            executor.submit(reply_async, session_webhook, message_info)
+            return jsonify({})
         
         # 处理不同类型的消息
         if msg_type == 'text':
@@ -103,13 +179,75 @@ def webhook():
             ))
     
     except Exception as e:
-        logger.error(f"处理消息时出错: {str(e)}", exc_info=True)
+        logger.error("处理消息时出错: %s", e, exc_info=True)
         return jsonify(dingtalk_utils.create_response_message(
             'text',
             "抱歉，处理您的消息时出现错误，请稍后再试。"
         ))
 
 
+def reply_async(session_webhook: str, message_info: dict):
+    """
+    在后台线程中处理消息，并通过会话Webhook回复
+    
+    Args:
+        session_webhook: 钉钉会话Webhook地址
+        message_info: 消息信息
+    """
+    try:
+        if message_info['msg_type'] == 'text':
+            response_text = handle_text_message(
+                message_info['sender_id'],
+                message_info['content'],
+                message_info['sender_nick']
+            )
+        else:
+            response_text = handle_audio_message(message_info)
+        
+        dingtalk_utils.send_text_message(session_webhook, response_text)
+    
+    except Exception as e:
+        logger.error("异步回复消息时出错: %s", e, exc_info=True)
+
+
+def coalesced_chat(user_id: str, message: str, system_prompt: str) -> str:
+    """
+    调用AI对话，同一用户的相同消息在处理中或完成后短时间内复用同一结果
+    
+    Args:
+        user_id: 用户ID
+        message: 消息内容
+        system_prompt: 系统提示词
+        
+    Returns:
+        str: AI的回复
+    """
+    key = hashlib.blake2b(f"{user_id}|{message}".encode('utf-8'), digest_size=16).digest()
+    
+    with _inflight_lock:
+        future = _inflight_chats.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight_chats[key] = future
+    
+    if is_owner:
+        try:
+            future.set_result(openai_utils.chat(
+                user_id=user_id,
+                message=message,
+                system_prompt=system_prompt
+            ))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            timer = threading.Timer(INFLIGHT_TTL, _inflight_chats.pop, args=(key, None))
+            timer.daemon = True
+            timer.start()
+    
+    return future.result()
+
+
 def handle_text_message(user_id: str, message: str, user_name: str) -> str:
     """
     处理文本消息
@@ -124,20 +262,20 @@ def handle_text_message(user_id: str, message: str, user_name: str) -> str:
     """
     try:
         # 检查是否需要生成报告
-        if openai_utils.should_generate_report(message, Config.REPORT_TRIGGER_KEYWORDS):
+        if openai_utils.should_generate_report(message, REPORT_KWS):
             return handle_report_request(user_id, message, user_name)
         
         # 普通对话
-        response = openai_utils.chat(
+        response = coalesced_chat(
             user_id=user_id,
             message=message,
-            system_prompt=Config.SYSTEM_PROMPT
+            system_prompt=SYSTEM_PROMPT
         )
         
         return response
     
     except Exception as e:
-        logger.error(f"处理文本消息时出错: {str(e)}")
+        logger.error("处理文本消息时出错: %s", e)
         return "抱歉，处理您的消息时出现错误。"
 
 
@@ -154,47 +292,36 @@ def handle_report_request(user_id: str, message: str, user_name: str) -> str:
         str: 回复内容
     """
     try:
-        # 先回复用户正在生成
-        response_text = f"收到您的请求，正在为您生成详细报告，请稍候...\n\n主题：{message}"
-        
         # 生成报告内容
-        logger.info(f"开始生成报告: {message}")
+        logger.info("开始生成报告: %s", message)
         report_content = openai_utils.generate_report_content(
             topic=message,
-            system_prompt=Config.SYSTEM_PROMPT
+            system_prompt=SYSTEM_PROMPT
         )
         
         # 生成PDF
         logger.info("开始生成PDF")
-        pdf_path = pdf_generator.generate_report_pdf(
+        pdf_path = pdf_generator.submit_report_pdf(
             content=report_content,
             title=f"AI报告 - {message[:30]}"
-        )
+        ).result()
         
-        logger.info(f"PDF生成成功: {pdf_path}")
+        logger.info("PDF生成成功: %s", pdf_path)
         
         # 注意：这里需要将PDF上传到可访问的服务器或云存储
         # 由于是示例代码，这里只返回本地路径提示
         # 实际部署时需要上传到OSS/S3等云存储服务
         
-        response_text = f"""报告已生成完成！
-
-📊 报告主题：{message}
-👤 请求人：{user_name}
-📄 文件已保存到服务器
-
-由于当前环境限制，PDF文件已保存在服务器本地。
-在生产环境中，文件将上传到云存储并提供下载链接。
-
-报告摘要：
-{report_content[:200]}...
-
-完整内容请查看PDF文件。"""
+        response_text = REPORT_RESPONSE_TEMPLATE(
+            topic=message,
+            user_name=user_name,
+            summary=report_content[:200]
+        )
         
         return response_text
     
     except Exception as e:
-        logger.error(f"生成报告时出错: {str(e)}")
+        logger.error("生成报告时出错: %s", e)
         return f"抱歉，生成报告时出现错误：{str(e)}"
 
 
@@ -216,7 +343,7 @@ def handle_audio_message(message_info: dict) -> str:
             return "抱歉，无法获取语音文件。"
         
         # 检查是否配置了钉钉应用密钥
-        if not Config.DINGTALK_APP_KEY or not Config.DINGTALK_APP_SECRET:
+        if not DTK_APP_KEY or not DTK_SECRET:
             return """收到您的语音消息！
 
 由于语音消息处理需要配置钉钉应用密钥（DINGTALK_APP_KEY 和 DINGTALK_APP_SECRET），
@@ -229,24 +356,24 @@ def handle_audio_message(message_info: dict) -> str:
 感谢您的理解！"""
         
         # 处理语音消息
-        logger.info(f"开始处理语音消息: {download_code}")
+        logger.info("开始处理语音消息: %s", download_code)
         text = voice_processor.process_voice_message(download_code)
         
         # 如果识别成功，继续处理文字内容
         if text and not text.startswith("抱歉") and not text.startswith("语音识别失败"):
-            logger.info(f"语音识别结果: {text}")
+            logger.info("语音识别结果: %s", text)
             # 使用识别的文字内容进行对话
-            response = openai_utils.chat(
+            response = coalesced_chat(
                 user_id=sender_id,
                 message=text,
-                system_prompt=Config.SYSTEM_PROMPT
+                system_prompt=SYSTEM_PROMPT
             )
             return f"🎤 您说：{text}\n\n{response}"
         else:
             return text
     
     except Exception as e:
-        logger.error(f"处理语音消息时出错: {str(e)}")
+        logger.error("处理语音消息时出错: %s", e)
         return "抱歉，处理语音消息时出现错误。"
 
 
@@ -255,13 +382,24 @@ def health():
     """健康检查接口"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': os.popen('date').read().strip()
+        'timestamp': datetime.now(timezone.utc).isoformat()
     })
 
 
 # 启动定时任务调度器
 news_scheduler.start()
 
+
+def warm_up_connections():
+    """后台预热外部服务连接"""
+    dingtalk_utils.warm_up()
+    openai_utils.warm_up()
+
+
+threading.Thread(target=warm_up_connections, name='connection-warm-up', daemon=True).start()
+
 if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+    
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=Config.DEBUG)
+    WSGIServer(('0.0.0.0', port), app).serve_forever()
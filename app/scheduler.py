@@ -2,7 +2,7 @@
 定时任务调度器
 负责每天定时推送AI资讯
 """
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.gevent import GeventScheduler
 from apscheduler.triggers.cron import CronTrigger
 import sys
 import os
@@ -23,7 +23,7 @@ class NewsScheduler:
     
     def __init__(self):
         """初始化调度器"""
-        self.scheduler = BackgroundScheduler(timezone=Config.TIMEZONE)
+        self.scheduler = GeventScheduler(timezone=Config.TIMEZONE)
         self.dingtalk_utils = DingTalkUtils()
         self.news_utils = NewsUtils(api_key=Config.NEWS_API_KEY)
         self.webhook_url = Config.DINGTALK_WEBHOOK_URL
@@ -51,12 +51,12 @@ class NewsScheduler:
                 if result.get('errcode') == 0:
                     logger.info("AI资讯推送成功")
                 else:
-                    logger.error(f"AI资讯推送失败: {result}")
+                    logger.error("AI资讯推送失败: %s", result)
             else:
                 logger.warning("未配置Webhook URL，跳过推送")
         
         except Exception as e:
-            logger.error(f"推送每日资讯时出错: {str(e)}", exc_info=True)
+            logger.error("推送每日资讯时出错: %s", e, exc_info=True)
     
     def start(self):
         """启动调度器"""
@@ -65,22 +65,26 @@ class NewsScheduler:
             hour, minute = Config.DAILY_NEWS_TIME.split(':')
             
             # 添加定时任务
+            # jitter：多实例部署时错开请求；coalesce/max_instances：错过的触发只补一次且不重叠执行
             self.scheduler.add_job(
                 func=self.push_daily_news,
-                trigger=CronTrigger(hour=int(hour), minute=int(minute)),
+                trigger=CronTrigger(hour=int(hour), minute=int(minute), jitter=60),
                 id='daily_news_push',
                 name='每日AI资讯推送',
-                replace_existing=True
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+                misfire_grace_time=600
             )
             
-            logger.info(f"定时任务已配置：每天 {Config.DAILY_NEWS_TIME} 推送AI资讯")
+            logger.info("定时任务已配置：每天 %s 推送AI资讯", Config.DAILY_NEWS_TIME)
             
             # 启动调度器
             self.scheduler.start()
             logger.info("调度器已启动")
         
         except Exception as e:
-            logger.error(f"启动调度器失败: {str(e)}", exc_info=True)
+            logger.error("启动调度器失败: %s", e, exc_info=True)
     
     def stop(self):
         """停止调度器"""
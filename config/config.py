@@ -26,10 +26,20 @@ class Config:
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4-turbo')
     OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
     
+    # 语音识别配置（openai：使用托管Whisper；local：使用本地faster-whisper）
+    TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'openai')
+    WHISPER_LOCAL_MODEL = os.getenv('WHISPER_LOCAL_MODEL', 'base')
+    WHISPER_LOCAL_DEVICE = os.getenv('WHISPER_LOCAL_DEVICE', 'cuda')
+    WHISPER_LOCAL_COMPUTE_TYPE = os.getenv('WHISPER_LOCAL_COMPUTE_TYPE', 'int8_float16')
+    
     # NewsAPI配置
     NEWS_API_KEY = os.getenv('NEWS_API_KEY', '')
     NEWS_API_URL = 'https://newsapi.org/v2/everything'
     
+    # Redis缓存配置（未配置时不启用结果缓存）
+    REDIS_URL = os.getenv('REDIS_URL', '')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 86400))  # 24小时
+    
     # 文件存储配置
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/tmp/dingtalk-ai-assistant')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
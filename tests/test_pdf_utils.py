@@ -0,0 +1,67 @@
+"""
+PDF生成工具测试
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import pdf_utils
+from utils.pdf_utils import PDFGenerator
+
+
+def test_generate_report_pdf_many_returns_paths_in_order(tmp_path):
+    """并行生成多份报告，按输入顺序返回各自的文件路径"""
+    generator = PDFGenerator(output_dir=str(tmp_path))
+    items = [(f"# 报告{i}\n\n- 要点一\n- 要点二", f"标题{i}") for i in range(3)]
+    
+    paths = generator.generate_report_pdf_many(items)
+    
+    assert len(paths) == 3
+    assert len(set(paths)) == 3
+    for path in paths:
+        assert os.path.dirname(path) == str(tmp_path)
+        with open(path, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+
+
+def test_broken_process_pool_is_rebuilt(tmp_path):
+    """子进程异常退出导致进程池损坏后，后续提交会重建进程池"""
+    generator = PDFGenerator(output_dir=str(tmp_path))
+    broken_pool = pdf_utils._get_process_pool()
+    try:
+        broken_pool.submit(os._exit, 1).result()
+    except Exception:
+        pass
+    
+    paths = generator.generate_report_pdf_many([("正文", "标题")])
+    
+    assert os.path.exists(paths[0])
+    assert pdf_utils._get_process_pool() is not broken_pool
+
+
+def test_long_list_is_split_into_page_sized_paragraphs():
+    """长列表按MAX_LIST_LINES分段，列表项中的代码块不丢失"""
+    generator = PDFGenerator()
+    count = pdf_utils.MAX_LIST_LINES * 2 + 1
+    content = "\n".join(f"- 列表项{i}" for i in range(count)) + "\n\n  ```\n  code in list\n  ```\n"
+    
+    texts = [getattr(flowable, 'text', '') for flowable in
+             pdf_utils._iter_flowables(content, generator.styles)]
+    
+    assert [text.count('• ') for text in texts[:3]] == [pdf_utils.MAX_LIST_LINES, pdf_utils.MAX_LIST_LINES, 1]
+    assert 'code in list' in texts[3]
+
+
+def test_inline_code_and_entities_are_escaped_once():
+    """行内代码和原文中的实体引用只转义一次"""
+    generator = PDFGenerator()
+    content = "## 比较 `a->b`\n\n- 条件 `x<y && z`\n\nAT&amp;T & 1 < 2"
+    
+    texts = [getattr(flowable, 'text', '') for flowable in
+             pdf_utils._iter_flowables(content, generator.styles)]
+    
+    assert any('a-&gt;b' in text for text in texts)
+    assert any('x&lt;y &amp;&amp; z' in text for text in texts)
+    assert any('AT&amp;T &amp; 1 &lt; 2' in text for text in texts)
+    assert not any('&amp;lt;' in text or '&amp;amp;' in text for text in texts)
@@ -3,12 +3,30 @@
 包括语音文件下载、格式转换和语音识别
 """
 import os
-import requests
+import time
+import shutil
+import subprocess
+import threading
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
+
+from utils.cache import ResultCache, make_cache_key
+from utils.http import create_session
 
 logger = logging.getLogger(__name__)
 
+# 钉钉access_token有效期为7200秒，提前刷新以留出余量
+ACCESS_TOKEN_TTL = 7000
+
+# 导入时查找一次ffmpeg，未安装时为None
+FFMPEG = shutil.which('ffmpeg')
+
+# 流式下载的分块大小
+CHUNK_SIZE = 64 * 1024
+
+# 复用连接池，避免每次请求都重新建立TCP+TLS连接
+_SESSION = create_session()
+
 
 class AudioUtils:
     """音频处理工具类"""
@@ -23,18 +41,17 @@ class AudioUtils:
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
     
-    def download_audio_from_dingtalk(self, download_code: str, access_token: str, 
-                                     filename: Optional[str] = None) -> Optional[str]:
+    def download_audio_from_dingtalk(self, download_code: str, 
+                                     access_token: str) -> Optional[bytes]:
         """
-        从钉钉下载音频文件
+        从钉钉下载音频文件（直接返回内存中的数据，不落盘）
         
         Args:
             download_code: 下载码
             access_token: 访问令牌
-            filename: 保存的文件名（可选）
             
         Returns:
-            str: 保存的文件路径，失败返回None
+            bytes: 音频数据，失败返回None
         """
         try:
             # 钉钉机器人下载文件的API
@@ -44,59 +61,108 @@ class AudioUtils:
                 'file_key': download_code
             }
             
-            response = requests.get(url, params=params, timeout=30)
+            response = _SESSION.get(url, params=params, timeout=30)
             response.raise_for_status()
             
-            # 生成文件名
-            if not filename:
-                filename = f"audio_{download_code[:10]}.amr"
-            
-            filepath = os.path.join(self.output_dir, filename)
-            
-            # 保存文件
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            logger.info(f"音频文件下载成功: {filepath}")
-            return filepath
+            logger.info(f"音频文件下载成功: {len(response.content)} 字节")
+            return response.content
         
         except Exception as e:
             logger.error(f"下载音频文件失败: {str(e)}")
             return None
     
-    def convert_amr_to_mp3(self, amr_path: str) -> Optional[str]:
+    def download_audio_as_wav(self, download_code: str, 
+                              access_token: str) -> Optional[bytes]:
         """
-        将AMR格式转换为MP3格式
-        使用ffmpeg进行转换
+        从钉钉流式下载音频，边下载边通过ffmpeg转换为16kHz单声道WAV
         
         Args:
-            amr_path: AMR文件路径
+            download_code: 下载码
+            access_token: 访问令牌
             
         Returns:
-            str: MP3文件路径，失败返回None
+            bytes: WAV音频数据，ffmpeg不可用或转换失败返回None
         """
+        # 检查ffmpeg是否安装
+        if FFMPEG is None:
+            logger.warning("ffmpeg未安装，跳过格式转换")
+            return None
+        
         try:
-            # 检查ffmpeg是否安装
-            if os.system('which ffmpeg > /dev/null 2>&1') != 0:
-                logger.warning("ffmpeg未安装，跳过格式转换")
-                return amr_path  # 返回原文件
+            url = "https://oapi.dingtalk.com/robot/messageFiles/download"
+            params = {
+                'access_token': access_token,
+                'file_key': download_code
+            }
             
-            mp3_path = amr_path.rsplit('.', 1)[0] + '.mp3'
+            with _SESSION.get(url, params=params, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                
+                # 使用ffmpeg转换（stdin读入，stdout输出）
+                process = subprocess.Popen(
+                    [FFMPEG, '-i', 'pipe:0', '-f', 'wav', '-acodec', 'pcm_s16le',
+                     '-ar', '16000', '-ac', '1', 'pipe:1'],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
+                )
+                try:
+                    # 在后台线程中把下载的数据块写入ffmpeg，避免管道互相阻塞
+                    download_errors: List[Exception] = []
+                    feeder = threading.Thread(
+                        target=self._feed_chunks,
+                        args=(response.iter_content(chunk_size=CHUNK_SIZE), process.stdin, download_errors),
+                        daemon=True
+                    )
+                    feeder.start()
+                    wav_data = process.stdout.read()
+                    process.wait()
+                    feeder.join()
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+                        process.wait()
             
-            # 使用ffmpeg转换
-            cmd = f"ffmpeg -i {amr_path} -ar 16000 -ac 1 {mp3_path} -y > /dev/null 2>&1"
-            result = os.system(cmd)
+            # 下载中断时ffmpeg只收到部分数据，不能当作转换成功
+            if download_errors:
+                logger.error(f"下载音频文件失败: {str(download_errors[0])}")
+                return None
             
-            if result == 0 and os.path.exists(mp3_path):
-                logger.info(f"音频格式转换成功: {mp3_path}")
-                return mp3_path
+            if process.returncode == 0 and wav_data:
+                logger.info(f"音频格式转换成功: {len(wav_data)} 字节")
+                return wav_data
             else:
                 logger.warning("音频格式转换失败，使用原格式")
-                return amr_path
+                return None
         
         except Exception as e:
             logger.error(f"转换音频格式时出错: {str(e)}")
-            return amr_path
+            return None
+    
+    @staticmethod
+    def _feed_chunks(chunks, stdin, errors: List[Exception]):
+        """
+        将下载的数据块写入子进程的stdin，写完后关闭
+        
+        Args:
+            chunks: 数据块迭代器
+            stdin: 子进程的stdin
+            errors: 下载出错时记录异常的列表
+        """
+        try:
+            for chunk in chunks:
+                try:
+                    stdin.write(chunk)
+                except BrokenPipeError:
+                    # ffmpeg已提前退出，由其返回码判断转换结果
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
     
     def get_access_token(self, app_key: str, app_secret: str) -> Optional[str]:
         """
@@ -116,7 +182,7 @@ class AudioUtils:
                 'appsecret': app_secret
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = _SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -131,27 +197,14 @@ class AudioUtils:
         except Exception as e:
             logger.error(f"获取access_token时出错: {str(e)}")
             return None
-    
-    def cleanup_audio_file(self, filepath: str):
-        """
-        清理音频文件
-        
-        Args:
-            filepath: 文件路径
-        """
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                logger.info(f"已清理音频文件: {filepath}")
-        except Exception as e:
-            logger.warning(f"清理音频文件失败: {str(e)}")
 
 
 class VoiceProcessor:
     """语音处理器（集成音频下载和识别）"""
     
     def __init__(self, openai_utils, audio_utils: AudioUtils, 
-                 app_key: str, app_secret: str):
+                 app_key: str, app_secret: str, transcriber=None,
+                 cache: Optional[ResultCache] = None):
         """
         初始化语音处理器
         
@@ -160,21 +213,70 @@ class VoiceProcessor:
             audio_utils: 音频工具实例
             app_key: 钉钉应用Key
             app_secret: 钉钉应用Secret
+            transcriber: 语音识别器（可选，默认使用OpenAI Whisper）
+            cache: 结果缓存（可选，用于缓存识别结果并在多进程间共享access_token）
         """
         self.openai_utils = openai_utils
+        self.transcriber = transcriber or openai_utils
+        self.cache = cache
         self.audio_utils = audio_utils
         self.app_key = app_key
         self.app_secret = app_secret
-        self._access_token = None
+        self._access_token = None  # (token, 过期时间戳)
+        self._token_lock = threading.Lock()
     
     def get_access_token(self) -> Optional[str]:
-        """获取或刷新access_token"""
-        if not self._access_token:
-            self._access_token = self.audio_utils.get_access_token(
-                self.app_key, 
-                self.app_secret
-            )
-        return self._access_token
+        """获取或刷新access_token（过期前60秒自动刷新）"""
+        with self._token_lock:
+            if self._access_token and time.time() < self._access_token[1] - 60:
+                return self._access_token[0]
+            
+            # 优先使用其他进程已获取的token（按共享缓存中的剩余有效期在本地保留）
+            cache_key = f"dingtalk:token:{self.app_key}"
+            token, ttl = None, None
+            if self.cache is not None:
+                token = self.cache.get(cache_key)
+                ttl = self.cache.ttl(cache_key) if token else None
+            
+            if not token or ttl is None or ttl <= 60:
+                token = self.audio_utils.get_access_token(
+                    self.app_key, 
+                    self.app_secret
+                )
+                ttl = ACCESS_TOKEN_TTL
+                if token and self.cache is not None:
+                    self.cache.set(cache_key, token, ttl=ACCESS_TOKEN_TTL)
+            
+            if token:
+                self._access_token = (token, time.time() + ttl)
+            return token
+    
+    def _download_audio(self, download_code: str, 
+                        access_token: str) -> Tuple[Optional[bytes], str]:
+        """
+        下载语音并尽量转换为WAV
+        
+        Args:
+            download_code: 下载码
+            access_token: 访问令牌
+            
+        Returns:
+            tuple: (音频数据, 文件名)，下载失败时音频数据为None
+        """
+        # 下载并转换为WAV（流式）
+        audio_data = self.audio_utils.download_audio_as_wav(
+            download_code=download_code,
+            access_token=access_token
+        )
+        if audio_data:
+            return audio_data, 'voice.wav'
+        
+        # 转换不可用时下载原格式
+        audio_data = self.audio_utils.download_audio_from_dingtalk(
+            download_code=download_code,
+            access_token=access_token
+        )
+        return audio_data, 'voice.amr'
     
     def process_voice_message(self, download_code: str) -> str:
         """
@@ -186,39 +288,30 @@ class VoiceProcessor:
         Returns:
             str: 识别的文字内容
         """
-        audio_path = None
-        converted_path = None
-        
         try:
             # 获取access_token
             access_token = self.get_access_token()
             if not access_token:
                 return "抱歉，无法获取访问令牌，语音识别失败。"
             
-            # 下载音频文件
-            audio_path = self.audio_utils.download_audio_from_dingtalk(
-                download_code=download_code,
-                access_token=access_token
-            )
-            
-            if not audio_path:
+            audio_data, filename = self._download_audio(download_code, access_token)
+            if not audio_data:
                 return "抱歉，下载语音文件失败。"
             
-            # 转换格式（如果需要）
-            converted_path = self.audio_utils.convert_amr_to_mp3(audio_path)
+            # 相同音频直接返回缓存的识别结果
+            if self.cache is not None:
+                cache_key = make_cache_key('tr', audio_data)
+                text = self.cache.get(cache_key)
+                if text is not None:
+                    return text
             
-            # 使用OpenAI Whisper识别
-            text = self.openai_utils.transcribe_audio(converted_path)
+            # 使用Whisper识别
+            text = self.transcriber.transcribe_audio(audio_data, filename)
             
+            if self.cache is not None and not text.startswith("语音识别失败"):
+                self.cache.set(cache_key, text)
             return text
         
         except Exception as e:
             logger.error(f"处理语音消息时出错: {str(e)}")
             return f"语音识别失败：{str(e)}"
-        
-        finally:
-            # 清理临时文件
-            if audio_path:
-                self.audio_utils.cleanup_audio_file(audio_path)
-            if converted_path and converted_path != audio_path:
-                self.audio_utils.cleanup_audio_file(converted_path)
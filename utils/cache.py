@@ -0,0 +1,92 @@
+"""
+结果缓存工具
+使用Redis缓存语音识别、AI对话等确定性结果
+"""
+import hashlib
+import logging
+from typing import Optional, Union
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(prefix: str, *parts: Union[str, bytes]) -> str:
+    """
+    根据内容生成缓存键
+    
+    Args:
+        prefix: 键前缀（如 tr、chat）
+        parts: 参与哈希的内容
+        
+    Returns:
+        str: 形如 "prefix:<hex>" 的缓存键
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode('utf-8'))
+        digest.update(b'\0')
+    return f"{prefix}:{digest.hexdigest()}"
+
+
+class ResultCache:
+    """Redis结果缓存（读写失败时只记录日志，不影响主流程）"""
+    
+    def __init__(self, redis_url: str, ttl: int = 86400):
+        """
+        初始化Redis连接池
+        
+        Args:
+            redis_url: Redis连接地址
+            ttl: 默认过期时间（秒）
+        """
+        self.ttl = ttl
+        pool = redis.ConnectionPool.from_url(redis_url, decode_responses=True)
+        self.client = redis.Redis(connection_pool=pool)
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            str: 缓存值，不存在或出错时返回None
+        """
+        try:
+            return self.client.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"读取缓存失败: {str(e)}")
+            return None
+    
+    def ttl(self, key: str) -> Optional[int]:
+        """
+        查询缓存的剩余有效期
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            int: 剩余秒数，不存在、未设置过期时间或出错时返回None
+        """
+        try:
+            remaining = self.client.ttl(key)
+        except redis.RedisError as e:
+            logger.warning(f"读取缓存有效期失败: {str(e)}")
+            return None
+        return remaining if remaining >= 0 else None
+    
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 过期时间（秒，可选，默认使用初始化时的ttl）
+        """
+        try:
+            self.client.setex(key, ttl or self.ttl, value)
+        except redis.RedisError as e:
+            logger.warning(f"写入缓存失败: {str(e)}")
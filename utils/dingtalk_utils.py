@@ -8,8 +8,20 @@ import hashlib
 import base64
 import json
 import requests
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
+from utils.http import create_session
+
+# 复用连接池，避免每次请求都重新建立TCP+TLS连接
+_SESSION = create_session()
+
+
+@lru_cache(maxsize=4)
+def _secret_bytes(app_secret: str) -> bytes:
+    """缓存应用密钥的UTF-8编码结果"""
+    return app_secret.encode('utf-8')
+
 
 class DingTalkUtils:
     """钉钉工具类"""
@@ -27,22 +39,31 @@ class DingTalkUtils:
         Returns:
             bool: 验证是否通过
         """
-        # 检查时间戳是否在1小时内
+        # 检查时间戳是否在1小时内（先于HMAC计算，过期请求直接拒绝）
+        try:
+            request_time = int(timestamp)
+        except ValueError:
+            return False
         current_time = int(time.time() * 1000)
-        request_time = int(timestamp)
         if abs(current_time - request_time) > 3600000:  # 1小时 = 3600000毫秒
             return False
         
         # 计算签名
-        string_to_sign = f"{timestamp}\n{app_secret}"
-        hmac_code = hmac.new(
-            app_secret.encode('utf-8'),
-            string_to_sign.encode('utf-8'),
-            digestmod=hashlib.sha256
-        ).digest()
-        calculated_sign = base64.b64encode(hmac_code).decode('utf-8')
+        secret = _secret_bytes(app_secret)
+        string_to_sign = timestamp.encode('utf-8') + b'\n' + secret
+        hmac_code = hmac.new(secret, string_to_sign, digestmod=hashlib.sha256).digest()
+        calculated_sign = base64.b64encode(hmac_code)
         
-        return calculated_sign == sign
+        # 使用常量时间比较，防止时序攻击
+        return hmac.compare_digest(calculated_sign, sign.encode('utf-8'))
+    
+    @staticmethod
+    def warm_up():
+        """预先建立到钉钉开放平台的连接，避免首条消息承担TLS握手开销"""
+        try:
+            _SESSION.head('https://oapi.dingtalk.com/', timeout=5)
+        except requests.RequestException:
+            pass
     
     @staticmethod
     def send_text_message(webhook_url: str, content: str, 
@@ -72,7 +93,7 @@ class DingTalkUtils:
         }
         
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(webhook_url, json=data, headers=headers)
+        response = _SESSION.post(webhook_url, json=data, headers=headers)
         return response.json()
     
     @staticmethod
@@ -105,7 +126,7 @@ class DingTalkUtils:
         }
         
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(webhook_url, json=data, headers=headers)
+        response = _SESSION.post(webhook_url, json=data, headers=headers)
         return response.json()
     
     @staticmethod
@@ -135,7 +156,7 @@ class DingTalkUtils:
         }
         
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(webhook_url, json=data, headers=headers)
+        response = _SESSION.post(webhook_url, json=data, headers=headers)
         return response.json()
     
     @staticmethod
@@ -229,7 +250,7 @@ class DingTalkUtils:
             'access_token': access_token,
             'file_key': download_code
         }
-        response = requests.get(url, params=params)
+        response = _SESSION.get(url, params=params)
         if response.status_code == 200:
             return response.content
         else:
@@ -0,0 +1,33 @@
+"""
+HTTP连接工具
+提供统一配置连接池和重试策略的requests会话
+"""
+from typing import Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_session(pool_connections: int = 32, pool_maxsize: int = 64,
+                   backoff_factor: float = 0.2,
+                   status_forcelist: Optional[Sequence[int]] = None) -> requests.Session:
+    """
+    创建复用连接池的会话，避免每次请求都重新建立TCP+TLS连接
+    
+    Args:
+        pool_connections: 缓存的连接池（主机）数量
+        pool_maxsize: 每个连接池的最大连接数
+        backoff_factor: 重试退避系数
+        status_forcelist: 需要重试的HTTP状态码（可选）
+        
+    Returns:
+        requests.Session: 配置好的会话
+    """
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=3, backoff_factor=backoff_factor, status_forcelist=status_forcelist)
+    ))
+    return session
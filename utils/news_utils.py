@@ -2,33 +2,146 @@
 新闻资讯工具
 从各种来源获取AI相关资讯
 """
-import requests
-from typing import List, Dict, Any
+import asyncio
+import time
+import aiohttp
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
 
+from utils.http import create_session
+
 logger = logging.getLogger(__name__)
 
+# 默认的NewsAPI检索语句
+DEFAULT_NEWS_QUERY = 'artificial intelligence OR machine learning OR deep learning OR AI'
+
+# NewsAPI查询参数中不随请求变化的部分
+_NEWSAPI_BASE_PARAMS = {
+    'q': DEFAULT_NEWS_QUERY,
+    'language': 'en',
+    'sortBy': 'publishedAt'
+}
+
+# 星期的中文表示（datetime.weekday()下标）
+_WEEKDAYS = ('一', '二', '三', '四', '五', '六', '日')
+
+# 模拟新闻模板（published_at在调用时填入当天日期）
+_MOCK_NEWS_TEMPLATE: Tuple[Dict[str, Any], ...] = (
+    {
+        'title': 'OpenAI发布GPT-5：多模态能力大幅提升',
+        'description': 'OpenAI今日正式发布GPT-5模型，在图像理解、视频生成和代码编写等方面展现出革命性的进步。新模型支持更长的上下文窗口，推理能力显著增强。',
+        'url': 'https://openai.com',
+        'source': 'TechCrunch',
+        'published_at': '',
+        'image_url': ''
+    },
+    {
+        'title': '谷歌Gemini 2.0在多项基准测试中超越竞争对手',
+        'description': '谷歌最新发布的Gemini 2.0模型在MMLU、HumanEval等多项基准测试中取得领先成绩，特别是在数学推理和科学问题解答方面表现突出。',
+        'url': 'https://deepmind.google',
+        'source': 'The Verge',
+        'published_at': '',
+        'image_url': ''
+    },
+    {
+        'title': 'Meta开源Llama 4：参数规模达到5000亿',
+        'description': 'Meta宣布开源Llama 4系列模型，最大版本参数量达到5000亿，支持128种语言。这是迄今为止最大的开源语言模型。',
+        'url': 'https://ai.meta.com',
+        'source': 'VentureBeat',
+        'published_at': '',
+        'image_url': ''
+    },
+    {
+        'title': '自动驾驶技术突破：特斯拉FSD V13实现城市完全自动驾驶',
+        'description': '特斯拉最新的FSD V13版本在城市道路测试中实现零接管，标志着L4级自动驾驶技术的重大突破。',
+        'url': 'https://tesla.com',
+        'source': 'Reuters',
+        'published_at': '',
+        'image_url': ''
+    },
+    {
+        'title': 'AI芯片市场竞争加剧：英伟达、AMD和英特尔三足鼎立',
+        'description': '随着AI需求爆发，英伟达H200、AMD MI300和英特尔Gaudi 3在数据中心市场展开激烈竞争，推动AI算力成本持续下降。',
+        'url': 'https://nvidia.com',
+        'source': 'Bloomberg',
+        'published_at': '',
+        'image_url': ''
+    }
+)
+
+
+async def _fetch_json(session: aiohttp.ClientSession, url: str, 
+                      params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    异步请求并解析JSON
+    
+    Args:
+        session: aiohttp会话
+        url: 请求地址
+        params: 查询参数
+        
+    Returns:
+        dict: 响应JSON
+    """
+    async with session.get(url, params=params, 
+                           timeout=aiohttp.ClientTimeout(total=10)) as response:
+        response.raise_for_status()
+        return await response.json()
+
 
 class NewsUtils:
     """新闻工具类"""
     
-    def __init__(self, api_key: str = ""):
+    def __init__(self, api_key: str = "", ttl_seconds: int = 3600):
         """
         初始化新闻工具
         
         Args:
             api_key: NewsAPI密钥（可选）
+            ttl_seconds: 新闻缓存有效期（秒）
         """
         self.api_key = api_key
         self.newsapi_url = "https://newsapi.org/v2/everything"
+        self.ttl = ttl_seconds
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 同步接口复用的HTTP连接池
+        self._http = create_session(pool_connections=4, pool_maxsize=8, backoff_factor=0.3,
+                                    status_forcelist=[502, 503, 504])
+        # (检索语句, 起始日期, 条数) -> (缓存时间, 原始文章列表)
+        self._cache: Dict[tuple, Tuple[float, list]] = {}
     
-    def get_ai_news_from_newsapi(self, max_results: int = 5) -> List[Dict[str, Any]]:
+    def invalidate(self):
+        """清空新闻缓存"""
+        self._cache.clear()
+    
+    def close(self):
+        """关闭同步接口的HTTP连接池"""
+        self._http.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    async def __aenter__(self):
+        """在async with块内共享同一个ClientSession（复用连接）"""
+        self._session = aiohttp.ClientSession()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+    
+    def get_ai_news_from_newsapi(self, max_results: int = 5, 
+                                 queries: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
-        从NewsAPI获取AI相关新闻
+        从NewsAPI获取AI相关新闻（同步接口）
         
         Args:
             max_results: 最大结果数
+            queries: 检索语句列表（可选，默认检索AI相关新闻）
             
         Returns:
             list: 新闻列表
@@ -37,42 +150,122 @@ class NewsUtils:
             logger.warning("未配置NewsAPI密钥")
             return []
         
-        try:
-            # 计算昨天的日期
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        keys, stale_keys = self._prepare_fetch(max_results, queries)
+        for key in stale_keys:
+            try:
+                response = self._http.get(self.newsapi_url, params=self._build_params(key), timeout=10)
+                response.raise_for_status()
+                self._store_articles(key, response.json())
+            except Exception as e:
+                logger.error(f"从NewsAPI获取新闻失败: {str(e)}")
+        
+        return self._collect_news(keys, max_results)
+    
+    async def get_ai_news_from_newsapi_async(self, max_results: int = 5,
+                                             queries: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        从NewsAPI获取AI相关新闻，多个检索语句并发请求
+        
+        Args:
+            max_results: 最大结果数
+            queries: 检索语句列表（可选，默认检索AI相关新闻）
             
-            params = {
-                'apiKey': self.api_key,
-                'q': 'artificial intelligence OR machine learning OR deep learning OR AI',
-                'language': 'en',
-                'sortBy': 'publishedAt',
-                'from': yesterday,
-                'pageSize': max_results
-            }
+        Returns:
+            list: 新闻列表（按URL去重）
+        """
+        if not self.api_key:
+            logger.warning("未配置NewsAPI密钥")
+            return []
+        
+        keys, stale_keys = self._prepare_fetch(max_results, queries)
+        if stale_keys:
+            params_list = [self._build_params(key) for key in stale_keys]
             
-            response = requests.get(self.newsapi_url, params=params, timeout=10)
-            response.raise_for_status()
+            if self._session is not None:
+                responses = await self._fetch_all(self._session, params_list)
+            else:
+                async with aiohttp.ClientSession() as session:
+                    responses = await self._fetch_all(session, params_list)
             
-            data = response.json()
-            articles = data.get('articles', [])
+            for key, data in zip(stale_keys, responses):
+                if isinstance(data, Exception):
+                    logger.error(f"从NewsAPI获取新闻失败: {str(data)}")
+                    continue
+                self._store_articles(key, data)
+        
+        return self._collect_news(keys, max_results)
+    
+    def _prepare_fetch(self, max_results: int, 
+                       queries: Optional[List[str]]) -> Tuple[List[tuple], List[tuple]]:
+        """
+        计算本次请求的缓存键，并清理过期缓存
+        
+        Args:
+            max_results: 最大结果数
+            queries: 检索语句列表
             
-            # 格式化新闻
-            news_list = []
-            for article in articles:
+        Returns:
+            tuple: (全部缓存键, 缓存缺失或已过期需要重新请求的缓存键)
+        """
+        # 计算昨天的日期
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        keys = [(query, yesterday, max_results) for query in (queries or [DEFAULT_NEWS_QUERY])]
+        now = time.monotonic()
+        
+        # 清理已过期且不再被请求的缓存
+        for key in [k for k, (ts, _) in self._cache.items() 
+                    if k not in keys and now - ts >= self.ttl]:
+            del self._cache[key]
+        
+        # 只请求缓存缺失或已过期的检索语句
+        stale_keys = [key for key in keys 
+                      if key not in self._cache or now - self._cache[key][0] >= self.ttl]
+        return keys, stale_keys
+    
+    def _build_params(self, key: tuple) -> Dict[str, Any]:
+        """根据缓存键构造NewsAPI查询参数"""
+        query, from_date, page_size = key
+        params = {**_NEWSAPI_BASE_PARAMS, 'apiKey': self.api_key, 'from': from_date, 'pageSize': page_size}
+        if query != DEFAULT_NEWS_QUERY:
+            params['q'] = query
+        return params
+    
+    def _store_articles(self, key: tuple, data: Dict[str, Any]):
+        """写入缓存（结果变少时不覆盖，避免降级的响应替换更完整的结果）"""
+        articles = data.get('articles', [])
+        cached = self._cache.get(key)
+        if cached is None or len(articles) >= len(cached[1]):
+            self._cache[key] = (time.monotonic(), articles)
+    
+    def _collect_news(self, keys: List[tuple], max_results: int) -> List[Dict[str, Any]]:
+        """从缓存中汇总并格式化新闻（按URL去重）"""
+        news_list = []
+        seen_urls = set()
+        for key in keys:
+            for article in self._cache.get(key, (0, []))[1]:
+                url = article.get('url', '')
+                if url in seen_urls:
+                    continue
+                seen_urls.add(url)
                 news_list.append({
                     'title': article.get('title', ''),
                     'description': article.get('description', ''),
-                    'url': article.get('url', ''),
+                    'url': url,
                     'source': article.get('source', {}).get('name', ''),
                     'published_at': article.get('publishedAt', ''),
                     'image_url': article.get('urlToImage', '')
                 })
-            
-            return news_list
         
-        except Exception as e:
-            logger.error(f"从NewsAPI获取新闻失败: {str(e)}")
-            return []
+        return news_list[:max_results]
+    
+    async def _fetch_all(self, session: aiohttp.ClientSession, 
+                         params_list: List[Dict[str, Any]]) -> list:
+        """并发执行所有NewsAPI请求，单个失败不影响其他请求"""
+        return await asyncio.gather(
+            *(_fetch_json(session, self.newsapi_url, params) for params in params_list),
+            return_exceptions=True
+        )
     
     def get_ai_news_mock(self) -> List[Dict[str, Any]]:
         """
@@ -82,49 +275,7 @@ class NewsUtils:
             list: 新闻列表
         """
         today = datetime.now().strftime('%Y-%m-%d')
-        
-        return [
-            {
-                'title': 'OpenAI发布GPT-5：多模态能力大幅提升',
-                'description': 'OpenAI今日正式发布GPT-5模型，在图像理解、视频生成和代码编写等方面展现出革命性的进步。新模型支持更长的上下文窗口，推理能力显著增强。',
-                'url': 'https://openai.com',
-                'source': 'TechCrunch',
-                'published_at': today,
-                'image_url': ''
-            },
-            {
-                'title': '谷歌Gemini 2.0在多项基准测试中超越竞争对手',
-                'description': '谷歌最新发布的Gemini 2.0模型在MMLU、HumanEval等多项基准测试中取得领先成绩，特别是在数学推理和科学问题解答方面表现突出。',
-                'url': 'https://deepmind.google',
-                'source': 'The Verge',
-                'published_at': today,
-                'image_url': ''
-            },
-            {
-                'title': 'Meta开源Llama 4：参数规模达到5000亿',
-                'description': 'Meta宣布开源Llama 4系列模型，最大版本参数量达到5000亿，支持128种语言。这是迄今为止最大的开源语言模型。',
-                'url': 'https://ai.meta.com',
-                'source': 'VentureBeat',
-                'published_at': today,
-                'image_url': ''
-            },
-            {
-                'title': '自动驾驶技术突破：特斯拉FSD V13实现城市完全自动驾驶',
-                'description': '特斯拉最新的FSD V13版本在城市道路测试中实现零接管，标志着L4级自动驾驶技术的重大突破。',
-                'url': 'https://tesla.com',
-                'source': 'Reuters',
-                'published_at': today,
-                'image_url': ''
-            },
-            {
-                'title': 'AI芯片市场竞争加剧：英伟达、AMD和英特尔三足鼎立',
-                'description': '随着AI需求爆发，英伟达H200、AMD MI300和英特尔Gaudi 3在数据中心市场展开激烈竞争，推动AI算力成本持续下降。',
-                'url': 'https://nvidia.com',
-                'source': 'Bloomberg',
-                'published_at': today,
-                'image_url': ''
-            }
-        ]
+        return [{**news, 'published_at': today} for news in _MOCK_NEWS_TEMPLATE]
     
     def format_news_as_markdown(self, news_list: List[Dict[str, Any]]) -> str:
         """
@@ -139,26 +290,29 @@ class NewsUtils:
         if not news_list:
             return "暂无最新AI资讯"
         
-        markdown = "# 🤖 今日AI资讯速递\n\n"
-        markdown += f"📅 {datetime.now().strftime('%Y年%m月%d日')} 星期{['一','二','三','四','五','六','日'][datetime.now().weekday()]}\n\n"
-        markdown += "---\n\n"
+        now = datetime.now()
+        parts = [
+            "# 🤖 今日AI资讯速递\n\n",
+            f"📅 {now.strftime('%Y年%m月%d日')} 星期{_WEEKDAYS[now.weekday()]}\n\n",
+            "---\n\n"
+        ]
         
         for i, news in enumerate(news_list, 1):
-            markdown += f"## {i}. {news['title']}\n\n"
+            parts.append(f"## {i}. {news['title']}\n\n")
             
             if news.get('description'):
-                markdown += f"{news['description']}\n\n"
+                parts.append(f"{news['description']}\n\n")
             
-            markdown += f"**来源**: {news.get('source', '未知')}\n\n"
+            parts.append(f"**来源**: {news.get('source', '未知')}\n\n")
             
             if news.get('url'):
-                markdown += f"**链接**: [查看详情]({news['url']})\n\n"
+                parts.append(f"**链接**: [查看详情]({news['url']})\n\n")
             
-            markdown += "---\n\n"
+            parts.append("---\n\n")
         
-        markdown += "\n💡 *由AI助手自动推送，祝您工作愉快！*"
+        parts.append("\n💡 *由AI助手自动推送，祝您工作愉快！*")
         
-        return markdown
+        return "".join(parts)
     
     def get_daily_news(self, use_mock: bool = False, max_results: int = 5) -> str:
         """
@@ -181,3 +335,25 @@ class NewsUtils:
                 news_list = self.get_ai_news_mock()
         
         return self.format_news_as_markdown(news_list)
+    
+    async def get_daily_news_async(self, use_mock: bool = False, max_results: int = 5) -> str:
+        """
+        获取每日AI资讯（Markdown格式，异步接口）
+        
+        Args:
+            use_mock: 是否使用模拟数据
+            max_results: 最大结果数
+            
+        Returns:
+            str: Markdown格式的资讯内容
+        """
+        if use_mock or not self.api_key:
+            news_list = self.get_ai_news_mock()
+        else:
+            news_list = await self.get_ai_news_from_newsapi_async(max_results)
+            # 如果API获取失败，使用模拟数据
+            if not news_list:
+                logger.info("API获取失败，使用模拟数据")
+                news_list = self.get_ai_news_mock()
+        
+        return self.format_news_as_markdown(news_list)
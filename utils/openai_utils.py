@@ -2,15 +2,52 @@
 OpenAI相关工具函数
 包括对话生成、语音识别等功能
 """
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict, deque
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple, Deque
+import asyncio
+import json
+import threading
 import os
 
+from utils.cache import ResultCache, make_cache_key
+
+try:
+    import ahocorasick
+except ImportError:  # 未安装pyahocorasick时退回逐个关键词匹配
+    ahocorasick = None
+
+# 每个用户保留的历史消息数（10轮对话）
+MAX_HISTORY_MESSAGES = 20
+
+# 保留对话历史的用户数上限（超出时淘汰最久未对话的用户）
+MAX_USERS = 10000
+
+# 单个用户的对话历史条目：(该用户历史的锁, system消息, 最近的对话消息)
+HistoryEntry = Tuple[threading.Lock, Optional[Dict[str, str]], Deque[Dict[str, str]]]
+
+# API请求超时（秒）与SDK内部重试次数
+REQUEST_TIMEOUT = 120
+MAX_RETRIES = 2
+
+# 上传音频的扩展名 -> Content-Type
+_AUDIO_CONTENT_TYPES = {
+    'wav': 'audio/wav',
+    'amr': 'audio/amr',
+    'mp3': 'audio/mpeg'
+}
+
+
+def _audio_content_type(filename: str) -> str:
+    """根据文件扩展名确定音频的Content-Type"""
+    return _AUDIO_CONTENT_TYPES.get(filename.rpartition('.')[2].lower(), 'application/octet-stream')
+
 
 class OpenAIUtils:
     """OpenAI工具类"""
     
-    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = 'gpt-4-turbo'):
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = 'gpt-4-turbo',
+                 cache: Optional[ResultCache] = None, max_users: int = MAX_USERS):
         """
         初始化OpenAI客户端
         
@@ -18,13 +55,97 @@ class OpenAIUtils:
             api_key: OpenAI API密钥
             base_url: API基础URL（可选）
             model: 使用的模型名称
+            cache: 结果缓存（可选）
+            max_users: 保留对话历史的用户数上限
         """
+        # openai SDK较重，在创建客户端时才导入
+        from openai import OpenAI, AsyncOpenAI
+        
         self.client = OpenAI(
             api_key=api_key,
-            base_url=base_url
+            base_url=base_url,
+            timeout=REQUEST_TIMEOUT,
+            max_retries=MAX_RETRIES
+        )
+        # AsyncOpenAI的连接池绑定创建它的事件循环，不能跨asyncio.run复用，异步接口每次调用时新建
+        self._new_async_client = partial(
+            AsyncOpenAI,
+            api_key=api_key,
+            base_url=base_url,
+            timeout=REQUEST_TIMEOUT,
+            max_retries=MAX_RETRIES
         )
         self.model = model
-        self.conversation_history: Dict[str, List[Dict[str, str]]] = {}
+        self.cache = cache
+        self.max_users = max_users
+        # user_id -> (该用户历史的锁, system消息, 最近的对话消息)，按最近对话时间排序
+        # 锁与历史存放在同一条目中，淘汰或清除用户时一并移除；调用API期间不持有该锁
+        self.conversation_history: 'OrderedDict[str, HistoryEntry]' = OrderedDict()
+        # 保护conversation_history自身结构（插入、排序、淘汰）的锁
+        self._history_lock = threading.Lock()
+        # 关键词元组 -> Aho-Corasick自动机
+        self._keyword_automata: Dict[Tuple[str, ...], Any] = {}
+    
+    def _get_history(self, user_id: str, system_prompt: str) -> 'HistoryEntry':
+        """
+        获取（不存在时初始化）用户的对话历史，并标记为最近使用
+        
+        Returns:
+            tuple: (该用户历史的锁, system消息, 最近的对话消息)
+        """
+        with self._history_lock:
+            entry = self.conversation_history.get(user_id)
+            if entry is not None:
+                self.conversation_history.move_to_end(user_id)
+                return entry
+            
+            system_msg = {"role": "system", "content": system_prompt} if system_prompt else None
+            entry = (threading.Lock(), system_msg, deque(maxlen=MAX_HISTORY_MESSAGES))
+            self.conversation_history[user_id] = entry
+            
+            # 超出用户数上限时淘汰最久未对话的用户（连同其锁）
+            while len(self.conversation_history) > self.max_users:
+                self.conversation_history.popitem(last=False)
+            return entry
+    
+    def _prepare_chat(self, user_id: str, message: str, system_prompt: str):
+        """
+        记录用户消息并构建请求消息列表
+        
+        Returns:
+            tuple: (对话历史条目, 请求消息列表, 缓存键, 缓存的回复)
+        """
+        entry = self._get_history(user_id, system_prompt)
+        lock, system_msg, history = entry
+        with lock:
+            # 添加用户消息（超出长度时deque自动丢弃最早的消息）
+            history.append({
+                "role": "user",
+                "content": message
+            })
+            messages = ([system_msg] if system_msg else []) + list(history)
+        
+        # 相同的对话上下文（含历史）直接复用缓存的回复
+        cache_key = None
+        cached_reply = None
+        if self.cache is not None:
+            cache_key = make_cache_key('chat', self.model, json.dumps(messages, ensure_ascii=False))
+            cached_reply = self.cache.get(cache_key)
+        
+        return entry, messages, cache_key, cached_reply
+    
+    def _finish_chat(self, entry: 'HistoryEntry', cache_key: Optional[str],
+                     assistant_message: str, from_cache: bool):
+        """缓存回复并添加到历史"""
+        if cache_key and not from_cache:
+            self.cache.set(cache_key, assistant_message)
+        
+        lock, _, history = entry
+        with lock:
+            history.append({
+                "role": "assistant",
+                "content": assistant_message
+            })
     
     def chat(self, user_id: str, message: str, system_prompt: str = "") -> str:
         """
@@ -38,62 +159,63 @@ class OpenAIUtils:
         Returns:
             str: AI的回复
         """
-        # 初始化或获取对话历史
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-            if system_prompt:
-                self.conversation_history[user_id].append({
-                    "role": "system",
-                    "content": system_prompt
-                })
-        
-        # 添加用户消息
-        self.conversation_history[user_id].append({
-            "role": "user",
-            "content": message
-        })
-        
-        # 限制历史记录长度（保留最近10轮对话）
-        if len(self.conversation_history[user_id]) > 21:  # system + 10轮对话(20条)
-            # 保留system消息和最近的20条消息
-            system_msg = [msg for msg in self.conversation_history[user_id] if msg['role'] == 'system']
-            recent_msgs = self.conversation_history[user_id][-20:]
-            self.conversation_history[user_id] = system_msg + recent_msgs
+        entry, messages, cache_key, assistant_message = self._prepare_chat(
+            user_id, message, system_prompt)
+        from_cache = assistant_message is not None
         
         try:
-            # 调用OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.conversation_history[user_id],
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            # 获取回复
-            assistant_message = response.choices[0].message.content
-            
-            # 添加助手回复到历史
-            self.conversation_history[user_id].append({
-                "role": "assistant",
-                "content": assistant_message
-            })
+            if not from_cache:
+                # 调用OpenAI API
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000
+                )
+                assistant_message = response.choices[0].message.content
             
+            self._finish_chat(entry, cache_key, assistant_message, from_cache)
             return assistant_message
         
         except Exception as e:
             return f"抱歉，处理您的请求时出现错误：{str(e)}"
     
-    def generate_report_content(self, topic: str, system_prompt: str = "") -> str:
+    async def chat_async(self, user_id: str, message: str, system_prompt: str = "") -> str:
         """
-        生成详细报告内容
+        与AI进行对话（异步接口，可通过asyncio.gather并发处理多个用户）
         
         Args:
-            topic: 报告主题
+            user_id: 用户ID（用于维护对话历史）
+            message: 用户消息
             system_prompt: 系统提示词
             
         Returns:
-            str: 报告内容
+            str: AI的回复
         """
+        entry, messages, cache_key, assistant_message = self._prepare_chat(
+            user_id, message, system_prompt)
+        from_cache = assistant_message is not None
+        
+        try:
+            if not from_cache:
+                async with self._new_async_client() as client:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=2000
+                    )
+                assistant_message = response.choices[0].message.content
+            
+            self._finish_chat(entry, cache_key, assistant_message, from_cache)
+            return assistant_message
+        
+        except Exception as e:
+            return f"抱歉，处理您的请求时出现错误：{str(e)}"
+    
+    @staticmethod
+    def _build_report_messages(topic: str, system_prompt: str) -> List[Dict[str, str]]:
+        """构建生成报告的请求消息"""
         prompt = f"""请针对以下主题生成一份详细的专业报告：
 
 主题：{topic}
@@ -112,8 +234,48 @@ class OpenAIUtils:
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    @staticmethod
+    def _build_section_messages(topic: str, section: str, 
+                                system_prompt: str) -> List[Dict[str, str]]:
+        """构建生成报告单个章节的请求消息"""
+        prompt = f"""请为主题为「{topic}」的专业报告撰写其中的「{section}」章节：
+
+要求：
+1. 只输出该章节内容，以二级标题“## {section}”开头
+2. 内容要专业、准确、有深度
+3. 使用Markdown格式组织内容
+4. 适当引用相关技术、案例或数据
+
+请开始撰写："""
+        
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def generate_report_content(self, topic: str, system_prompt: str = "") -> str:
+        """
+        生成详细报告内容
+        
+        Args:
+            topic: 报告主题
+            system_prompt: 系统提示词
+            
+        Returns:
+            str: 报告内容
+        """
+        messages = self._build_report_messages(topic, system_prompt)
         
         try:
+            if self.cache is not None:
+                cache_key = make_cache_key('report', self.model, system_prompt, topic)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
@@ -121,26 +283,101 @@ class OpenAIUtils:
                 max_tokens=4000
             )
             
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if self.cache is not None:
+                self.cache.set(cache_key, content)
+            return content
+        
+        except Exception as e:
+            return f"生成报告时出现错误：{str(e)}"
+    
+    async def generate_report_content_async(self, topic: str, system_prompt: str = "",
+                                            sections: Optional[List[str]] = None) -> str:
+        """
+        生成详细报告内容（异步接口）
+        
+        Args:
+            topic: 报告主题
+            system_prompt: 系统提示词
+            sections: 章节标题列表（可选，提供时各章节并发生成后按顺序拼接）
+            
+        Returns:
+            str: 报告内容
+        """
+        try:
+            if self.cache is not None:
+                cache_key = make_cache_key('report', self.model, system_prompt, topic, *(sections or []))
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            if sections:
+                message_lists = [self._build_section_messages(topic, section, system_prompt)
+                                 for section in sections]
+            else:
+                message_lists = [self._build_report_messages(topic, system_prompt)]
+            
+            # 各章节共用同一个客户端（同一事件循环内复用连接）
+            async with self._new_async_client() as client:
+                responses = await asyncio.gather(*(
+                    client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=4000
+                    )
+                    for messages in message_lists
+                ))
+            
+            parts = [response.choices[0].message.content for response in responses]
+            if sections:
+                parts.insert(0, f"# {topic}")
+            content = "\n\n".join(parts)
+            if self.cache is not None:
+                self.cache.set(cache_key, content)
+            return content
         
         except Exception as e:
             return f"生成报告时出现错误：{str(e)}"
     
-    def transcribe_audio(self, audio_file_path: str) -> str:
+    def transcribe_audio(self, audio_data: bytes, filename: str) -> str:
         """
-        将音频文件转换为文字
+        将音频数据转换为文字
         
         Args:
-            audio_file_path: 音频文件路径
+            audio_data: 音频数据
+            filename: 文件名（Whisper根据扩展名识别格式）
             
         Returns:
             str: 转录的文字内容
         """
         try:
-            with open(audio_file_path, 'rb') as audio_file:
-                transcript = self.client.audio.transcriptions.create(
+            transcript = self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=(filename, audio_data, _audio_content_type(filename)),
+                language="zh"  # 指定中文
+            )
+            return transcript.text
+        
+        except Exception as e:
+            return f"语音识别失败：{str(e)}"
+    
+    async def transcribe_audio_async(self, audio_data: bytes, filename: str) -> str:
+        """
+        将音频数据转换为文字（异步接口，多个语音可并发识别）
+        
+        Args:
+            audio_data: 音频数据
+            filename: 文件名（Whisper根据扩展名识别格式）
+            
+        Returns:
+            str: 转录的文字内容
+        """
+        try:
+            async with self._new_async_client() as client:
+                transcript = await client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_file,
+                    file=(filename, audio_data, _audio_content_type(filename)),
                     language="zh"  # 指定中文
                 )
             return transcript.text
@@ -148,6 +385,13 @@ class OpenAIUtils:
         except Exception as e:
             return f"语音识别失败：{str(e)}"
     
+    def warm_up(self):
+        """预先建立到OpenAI API的连接，避免首条消息承担TLS握手开销"""
+        try:
+            self.client.with_options(timeout=5, max_retries=0).models.list()
+        except Exception:
+            pass
+    
     def clear_conversation(self, user_id: str):
         """
         清除用户的对话历史
@@ -155,8 +399,20 @@ class OpenAIUtils:
         Args:
             user_id: 用户ID
         """
-        if user_id in self.conversation_history:
-            del self.conversation_history[user_id]
+        with self._history_lock:
+            self.conversation_history.pop(user_id, None)
+    
+    def _get_keyword_automaton(self, keywords: List[str]):
+        """获取（首次调用时构建）关键词对应的Aho-Corasick自动机"""
+        key = tuple(keywords)
+        automaton = self._keyword_automata.get(key)
+        if automaton is None:
+            automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                automaton.add_word(keyword, keyword)
+            automaton.make_automaton()
+            self._keyword_automata[key] = automaton
+        return automaton
     
     def should_generate_report(self, message: str, keywords: List[str]) -> bool:
         """
@@ -169,4 +425,10 @@ class OpenAIUtils:
         Returns:
             bool: 是否需要生成报告
         """
-        return any(keyword in message for keyword in keywords)
+        if not keywords:
+            return False
+        if ahocorasick is None:
+            return any(keyword in message for keyword in keywords)
+        
+        # 单次扫描消息，命中第一个关键词即返回
+        return next(self._get_keyword_automaton(keywords).iter(message), None) is not None
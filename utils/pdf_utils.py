@@ -2,17 +2,355 @@
 PDF生成工具
 使用ReportLab生成专业格式的PDF报告
 """
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+# ReportLab在首次生成PDF时才导入（多数请求不生成PDF，避免拖慢启动）
+import atexit
 import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from html import unescape
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# PDF文件写入缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 16
+
+# PDF渲染进程数上限（每个gunicorn worker各自持有一个进程池，总进程数随worker数成倍增加）
+MAX_PDF_WORKERS = min(2, os.cpu_count() or 1)
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# 中文字体注册状态（None表示尚未尝试注册）
+_FONT_REGISTERED: Optional[bool] = None
+_font_lock = threading.Lock()
+
+# 常见的中文字体路径（按优先级）
+_FONT_PATHS = (
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',
+    '/System/Library/Fonts/PingFang.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc'
+)
+
+# 合并为一个段落的列表项上限（约一页正文的行数）
+MAX_LIST_LINES = 30
+
+# 行内元素到ReportLab标签的映射
+_INLINE_TAGS = {'strong': 'b', 'emphasis': 'i'}
+
+
+@lru_cache(maxsize=1)
+def _markdown_parser():
+    """创建Markdown解析器（输出AST而非HTML）"""
+    import mistune
+    return mistune.create_markdown(renderer=None)
+
+
+@lru_cache(maxsize=1)
+def _reportlab() -> SimpleNamespace:
+    """导入生成PDF所需的ReportLab组件（首次调用时导入，之后直接复用）"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    return SimpleNamespace(A4=A4, cm=cm, SimpleDocTemplate=SimpleDocTemplate,
+                           Paragraph=Paragraph, Spacer=Spacer)
+
+
+def _render_inline(children: list) -> str:
+    """
+    将行内AST节点渲染为ReportLab段落标记
+    
+    Args:
+        children: 行内节点列表
+        
+    Returns:
+        str: 段落标记文本
+    """
+    parts = []
+    for token in children:
+        token_type = token['type']
+        # 纯文本节点最常见，优先判断
+        if token_type == 'text':
+            # mistune保留了原文中的实体引用（如&amp;），先还原再转义，避免重复转义
+            parts.append(escape(unescape(token['raw'])))
+        elif token_type == 'codespan':
+            # mistune已对行内代码做过HTML转义，直接使用
+            parts.append(token['raw'])
+        elif token_type in ('softbreak', 'linebreak'):
+            parts.append('<br/>')
+        elif token_type in _INLINE_TAGS:
+            tag = _INLINE_TAGS[token_type]
+            parts.append(f"<{tag}>{_render_inline(token['children'])}</{tag}>")
+        elif 'children' in token:
+            # 链接等其他容器节点只保留文本
+            parts.append(_render_inline(token['children']))
+        else:
+            parts.append(escape(token.get('raw', '')))
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=1)
+def _resolve_chinese_font() -> Optional[str]:
+    """查找系统中可用的中文字体，返回字体路径，找不到时返回None"""
+    for font_path in _FONT_PATHS:
+        if os.path.exists(font_path):
+            return font_path
+    return None
+
+
+def _ensure_font() -> bool:
+    """注册中文字体（每个进程只注册一次，并发调用时也只解析一次TTF），返回是否注册成功"""
+    global _FONT_REGISTERED
+    if _FONT_REGISTERED is not None:
+        return _FONT_REGISTERED
+    
+    with _font_lock:
+        if _FONT_REGISTERED is None:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            
+            font_path = _resolve_chinese_font()
+            try:
+                if font_path:
+                    pdfmetrics.registerFont(TTFont('Chinese', font_path))
+                _FONT_REGISTERED = bool(font_path)
+            except Exception:
+                _FONT_REGISTERED = False
+    return _FONT_REGISTERED
+
+
+@lru_cache(maxsize=2)
+def _build_styles(font_name: str) -> dict:
+    """
+    构建PDF样式（按字体缓存，所有实例共享）
+    
+    Args:
+        font_name: 字体名称
+        
+    Returns:
+        dict: 样式字典
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    
+    styles = getSampleStyleSheet()
+    
+    # 标题样式
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontName=font_name,
+        fontSize=24,
+        textColor=colors.HexColor('#1a1a1a'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+    
+    # 一级标题样式
+    heading1_style = ParagraphStyle(
+        'CustomHeading1',
+        parent=styles['Heading1'],
+        fontName=font_name,
+        fontSize=18,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceAfter=12,
+        spaceBefore=12
+    )
+    
+    # 二级标题样式
+    heading2_style = ParagraphStyle(
+        'CustomHeading2',
+        parent=styles['Heading2'],
+        fontName=font_name,
+        fontSize=14,
+        textColor=colors.HexColor('#34495e'),
+        spaceAfter=10,
+        spaceBefore=10
+    )
+    
+    # 正文样式
+    body_style = ParagraphStyle(
+        'CustomBody',
+        parent=styles['BodyText'],
+        fontName=font_name,
+        fontSize=11,
+        leading=18,
+        alignment=TA_JUSTIFY,
+        spaceAfter=10
+    )
+    
+    return {
+        'title': title_style,
+        'heading1': heading1_style,
+        'heading2': heading2_style,
+        'body': body_style
+    }
+
+
+def _paragraph(markup: str, style):
+    """创建段落"""
+    return _reportlab().Paragraph(markup, style)
+
+
+def _spacer(height_cm: float):
+    """创建指定高度（厘米）的间距"""
+    rl = _reportlab()
+    return rl.Spacer(1, height_cm*rl.cm)
+
+
+def _heading_flowables(token: dict, styles: dict):
+    """处理标题（### 及以下与 ## 共用二级标题样式）"""
+    style = styles['heading1'] if token['attrs']['level'] == 1 else styles['heading2']
+    yield _paragraph(_render_inline(token['children']), style)
+
+
+def _paragraph_flowables(token: dict, styles: dict):
+    """处理普通段落"""
+    yield _paragraph(_render_inline(token['children']), styles['body'])
+
+
+def _list_lines(token: dict):
+    """
+    展开列表（含嵌套列表）
+    
+    Yields:
+        str | dict: 列表项的段落标记，或无法并入段落的块级节点（如代码块）
+    """
+    attrs = token['attrs']
+    for number, item in enumerate(token['children'], attrs.get('start', 1)):
+        prefix = f"{number}. " if attrs.get('ordered') else '• '
+        for child in item['children']:
+            if child['type'] == 'list':
+                yield from _list_lines(child)
+            elif child['type'] in ('paragraph', 'block_text'):
+                yield prefix + _render_inline(child['children'])
+                prefix = ''
+            elif child['type'] != 'blank_line':
+                yield child
+
+
+def _list_flowables(token: dict, styles: dict):
+    """处理有序/无序列表（连续的列表项按页面大小合并为段落，减少段落解析与排版次数）"""
+    lines = []
+    for entry in _list_lines(token):
+        if isinstance(entry, str):
+            lines.append(entry)
+            # 过长的列表按页面大小分段
+            if len(lines) >= MAX_LIST_LINES:
+                yield _paragraph('<br/>'.join(lines), styles['body'])
+                lines = []
+            continue
+        
+        # 代码块等块级节点单独生成元素
+        if lines:
+            yield _paragraph('<br/>'.join(lines), styles['body'])
+            lines = []
+        yield from _iter_blocks([entry], styles)
+    
+    if lines:
+        yield _paragraph('<br/>'.join(lines), styles['body'])
+
+
+def _code_flowables(token: dict, styles: dict):
+    """处理代码块（保留换行）"""
+    code = escape(token['raw'].rstrip('\n')).replace('\n', '<br/>')
+    yield _paragraph(code, styles['body'])
+
+
+def _container_flowables(token: dict, styles: dict):
+    """处理引用等容器块"""
+    yield from _iter_blocks(token['children'], styles)
+
+
+def _spacer_flowables(token: dict, styles: dict):
+    """处理空行和分隔线"""
+    yield _spacer(0.3)
+
+
+# 块级节点类型 -> 处理函数
+_BLOCK_HANDLERS = {
+    'heading': _heading_flowables,
+    'paragraph': _paragraph_flowables,
+    'block_text': _paragraph_flowables,
+    'list': _list_flowables,
+    'block_code': _code_flowables,
+    'block_quote': _container_flowables,
+    'blank_line': _spacer_flowables,
+    'thematic_break': _spacer_flowables
+}
+
+
+def _iter_blocks(tokens: list, styles: dict):
+    """依次将块级节点转换为PDF元素，未知节点按正文处理"""
+    for token in tokens:
+        handler = _BLOCK_HANDLERS.get(token['type'])
+        if handler is not None:
+            yield from handler(token, styles)
+        elif 'children' in token:
+            yield from _iter_blocks(token['children'], styles)
+        elif token.get('raw'):
+            yield _paragraph(escape(token['raw']), styles['body'])
+
+
+def _iter_flowables(content: str, styles: dict):
+    """
+    将Markdown内容解析为AST，依次生成对应的PDF元素
+    
+    Args:
+        content: Markdown格式的内容
+        styles: 样式字典
+        
+    Yields:
+        Flowable: 段落或间距
+    """
+    yield from _iter_blocks(_markdown_parser()(content), styles)
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """获取（首次调用时创建）进程内共享的PDF渲染进程池"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=MAX_PDF_WORKERS)
+        return _process_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """丢弃已损坏的进程池（如子进程被OOM终止），下次提交时重新创建"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+@atexit.register
+def _shutdown_process_pool():
+    """进程退出时关闭PDF渲染进程池"""
+    with _pool_lock:
+        pool = _process_pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_pdf(content: str, title: str, output_dir: str) -> Future:
+    """提交PDF渲染任务，进程池已损坏时重建后重新提交"""
+    pool = _get_process_pool()
+    try:
+        return pool.submit(_build_pdf, content, title, output_dir)
+    except BrokenProcessPool:
+        _discard_process_pool(pool)
+        return _get_process_pool().submit(_build_pdf, content, title, output_dir)
+
+
+def _build_pdf(content: str, title: str, output_dir: str) -> str:
+    """在子进程中生成PDF报告（模块级函数，可被pickle）"""
+    return PDFGenerator(output_dir).generate_report_pdf(content, title)
 
 
 class PDFGenerator:
@@ -28,83 +366,21 @@ class PDFGenerator:
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
         
-        # 注册中文字体（使用系统自带字体）
-        try:
-            # 尝试注册常见的中文字体
-            font_paths = [
-                '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
-                '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',
-                '/System/Library/Fonts/PingFang.ttc',
-                '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc'
-            ]
-            
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    pdfmetrics.registerFont(TTFont('Chinese', font_path))
-                    self.has_chinese_font = True
-                    break
-            else:
-                self.has_chinese_font = False
-        except:
-            self.has_chinese_font = False
+        self._styles = None
+    
+    @property
+    def styles(self) -> dict:
+        """样式字典（首次生成PDF时构建）"""
+        if self._styles is None:
+            self._styles = self._get_styles()
+        return self._styles
     
     def _get_styles(self):
         """获取样式"""
-        styles = getSampleStyleSheet()
-        
         # 如果有中文字体，使用中文字体
+        self.has_chinese_font = _ensure_font()
         font_name = 'Chinese' if self.has_chinese_font else 'Helvetica'
-        
-        # 标题样式
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontName=font_name,
-            fontSize=24,
-            textColor=colors.HexColor('#1a1a1a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        # 一级标题样式
-        heading1_style = ParagraphStyle(
-            'CustomHeading1',
-            parent=styles['Heading1'],
-            fontName=font_name,
-            fontSize=18,
-            textColor=colors.HexColor('#2c3e50'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        # 二级标题样式
-        heading2_style = ParagraphStyle(
-            'CustomHeading2',
-            parent=styles['Heading2'],
-            fontName=font_name,
-            fontSize=14,
-            textColor=colors.HexColor('#34495e'),
-            spaceAfter=10,
-            spaceBefore=10
-        )
-        
-        # 正文样式
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['BodyText'],
-            fontName=font_name,
-            fontSize=11,
-            leading=18,
-            alignment=TA_JUSTIFY,
-            spaceAfter=10
-        )
-        
-        return {
-            'title': title_style,
-            'heading1': heading1_style,
-            'heading2': heading2_style,
-            'body': body_style
-        }
+        return _build_styles(font_name)
     
     def generate_report_pdf(self, content: str, title: str = "AI报告") -> str:
         """
@@ -117,74 +393,74 @@ class PDFGenerator:
         Returns:
             str: 生成的PDF文件路径
         """
-        # 生成文件名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"report_{timestamp}.pdf"
-        filepath = os.path.join(self.output_dir, filename)
+        rl = _reportlab()
         
-        # 创建PDF文档
-        doc = SimpleDocTemplate(
-            filepath,
-            pagesize=A4,
-            rightMargin=2*cm,
-            leftMargin=2*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm
-        )
+        # 生成文件名（文件名与文档内的生成时间使用同一时刻）
+        now = datetime.now()
+        # 随机后缀避免并行生成时同一秒内的文件名冲突
+        filename = f"report_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.pdf"
+        filepath = os.path.join(self.output_dir, filename)
         
         # 获取样式
-        styles = self._get_styles()
+        styles = self.styles
         
         # 构建文档内容
         story = []
         
         # 添加标题
-        story.append(Paragraph(title, styles['title']))
-        story.append(Spacer(1, 0.5*cm))
+        story.append(rl.Paragraph(title, styles['title']))
+        story.append(rl.Spacer(1, 0.5*rl.cm))
         
         # 添加生成时间
-        date_text = f"生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M')}"
-        story.append(Paragraph(date_text, styles['body']))
-        story.append(Spacer(1, 1*cm))
+        date_text = f"生成时间：{now.strftime('%Y年%m月%d日 %H:%M')}"
+        story.append(rl.Paragraph(date_text, styles['body']))
+        story.append(rl.Spacer(1, 1*rl.cm))
         
         # 解析Markdown内容并添加到PDF
-        lines = content.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                story.append(Spacer(1, 0.3*cm))
-                continue
-            
-            # 处理标题
-            if line.startswith('# '):
-                text = line[2:].strip()
-                story.append(Paragraph(text, styles['heading1']))
-            elif line.startswith('## '):
-                text = line[3:].strip()
-                story.append(Paragraph(text, styles['heading2']))
-            elif line.startswith('### '):
-                text = line[4:].strip()
-                story.append(Paragraph(text, styles['heading2']))
-            # 处理列表
-            elif line.startswith('- ') or line.startswith('* '):
-                text = '• ' + line[2:].strip()
-                story.append(Paragraph(text, styles['body']))
-            elif line.startswith('1. ') or line.startswith('2. ') or line.startswith('3. '):
-                story.append(Paragraph(line, styles['body']))
-            # 处理普通段落
-            else:
-                # 替换Markdown粗体标记
-                text = line.replace('**', '<b>').replace('**', '</b>')
-                text = text.replace('*', '<i>').replace('*', '</i>')
-                story.append(Paragraph(text, styles['body']))
-        
-        # 生成PDF
+        story.extend(_iter_flowables(content, styles))
+        
+        # 生成PDF（直接写入带缓冲的文件句柄）
         try:
-            doc.build(story)
+            with open(filepath, 'wb', buffering=WRITE_BUFFER_SIZE) as fh:
+                doc = rl.SimpleDocTemplate(
+                    fh,
+                    pagesize=rl.A4,
+                    rightMargin=2*rl.cm,
+                    leftMargin=2*rl.cm,
+                    topMargin=2*rl.cm,
+                    bottomMargin=2*rl.cm
+                )
+                doc.build(story)
             return filepath
         except Exception as e:
             raise Exception(f"生成PDF失败：{str(e)}")
     
+    def submit_report_pdf(self, content: str, title: str = "AI报告") -> Future:
+        """
+        提交到进程池生成PDF报告（排版为CPU密集型，在子进程中执行可绕开GIL）
+        
+        Args:
+            content: Markdown格式的报告内容
+            title: 报告标题
+            
+        Returns:
+            Future: 结果为生成的PDF文件路径
+        """
+        return _submit_pdf(content, title, self.output_dir)
+    
+    def generate_report_pdf_many(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        并行生成多份PDF报告
+        
+        Args:
+            items: (报告内容, 报告标题) 列表
+            
+        Returns:
+            list: 与输入顺序一致的PDF文件路径
+        """
+        futures = [self.submit_report_pdf(content, title) for content, title in items]
+        return [future.result() for future in futures]
+    
     def generate_simple_pdf(self, text: str, filename: Optional[str] = None) -> str:
         """
         生成简单的文本PDF
@@ -196,22 +472,25 @@ class PDFGenerator:
         Returns:
             str: 生成的PDF文件路径
         """
+        rl = _reportlab()
+        
         if not filename:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"document_{timestamp}.pdf"
         
         filepath = os.path.join(self.output_dir, filename)
         
-        doc = SimpleDocTemplate(filepath, pagesize=A4)
-        styles = self._get_styles()
+        styles = self.styles
         story = []
         
         # 分段处理文本
         paragraphs = text.split('\n\n')
         for para in paragraphs:
             if para.strip():
-                story.append(Paragraph(para.strip(), styles['body']))
-                story.append(Spacer(1, 0.5*cm))
+                story.append(rl.Paragraph(para.strip(), styles['body']))
+                story.append(rl.Spacer(1, 0.5*rl.cm))
         
-        doc.build(story)
+        with open(filepath, 'wb', buffering=WRITE_BUFFER_SIZE) as fh:
+            doc = rl.SimpleDocTemplate(fh, pagesize=rl.A4)
+            doc.build(story)
         return filepath
@@ -0,0 +1,64 @@
+"""
+本地语音识别工具
+使用faster-whisper在本地GPU上推理
+"""
+import io
+import logging
+
+from gevent.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+
+class LocalWhisperTranscriber:
+    """本地Whisper转录器（在独立的系统线程中推理）"""
+    
+    def __init__(self, model_size: str = 'base', device: str = 'cuda',
+                 compute_type: str = 'int8_float16', batch_size: int = 16):
+        """
+        加载本地Whisper模型并创建推理线程
+        
+        Args:
+            model_size: 模型规模（tiny/base/small/medium/large-v3）
+            device: 推理设备（cuda/cpu）
+            compute_type: 计算精度（int8量化可减半显存）
+            batch_size: 单条语音按30秒切分后，每次前向推理的片段数
+        """
+        # faster-whisper为可选依赖，仅在启用本地识别时导入
+        from faster_whisper import WhisperModel, BatchedInferencePipeline
+        
+        model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.batch_size = batch_size
+        # monkey patch后threading.Thread只是greenlet，CPU密集的推理会阻塞整个hub，
+        # 因此使用gevent线程池中的系统线程推理；单线程保证同一时刻只有一个推理任务占用模型
+        self._pool = ThreadPool(1)
+        logger.info(f"本地Whisper模型已加载: {model_size} ({device}, {compute_type})")
+    
+    def transcribe_audio(self, audio_data: bytes, filename: str = '') -> str:
+        """
+        将音频数据转换为文字（与OpenAIUtils.transcribe_audio接口一致）
+        
+        Args:
+            audio_data: 音频数据
+            filename: 文件名（本地推理不需要，仅为保持接口一致）
+            
+        Returns:
+            str: 转录的文字内容
+        """
+        try:
+            # 等待推理结果时只挂起当前greenlet
+            return self._pool.apply(self._transcribe, (audio_data,))
+        except Exception as e:
+            logger.error(f"本地语音识别失败: {str(e)}")
+            return f"语音识别失败：{str(e)}"
+    
+    def _transcribe(self, audio_data: bytes) -> str:
+        """在推理线程中识别单条语音"""
+        segments, _ = self.pipeline.transcribe(
+            io.BytesIO(audio_data),
+            language='zh',
+            batch_size=self.batch_size,
+            chunk_length=30
+        )
+        return ''.join(segment.text for segment in segments)